@@ -1,15 +1,19 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from sqlalchemy.orm import Session
-import uvicorn
+import asyncio
+import json
 import os
+import threading
 from datetime import datetime
 from rag_model import LangGraphRAG
-from models import create_tables, get_db, Project, Chat, Message
+from models import create_tables, get_db, engine, SessionLocal, Project, Chat, Message
 
-app = FastAPI(title="RAG API", version="2.0.0")
+app = FastAPI(title="RAG API", version="2.0.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,12 +23,76 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create database tables on startup
-create_tables()
+class StreamSafeGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves the server-sent event stream uncompressed so tokens flush immediately"""
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/query/stream":
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
 
-# Global RAG systems dict (project_id -> RAG instance)
+# Compress larger responses such as answers and chat histories
+app.add_middleware(StreamSafeGZipMiddleware, minimum_size=1024)
+
+@app.on_event("startup")
+def ensure_tables():
+    """Create database tables when not started through gunicorn.conf.py, e.g. uvicorn --reload"""
+    if os.environ.get("RAG_SCHEMA_READY") != "1":
+        create_tables()
+
+@app.on_event("shutdown")
+def close_db_pool():
+    """Close pooled database connections"""
+    engine.dispose()
+
+# Per-worker RAG systems dict (project_id -> RAG instance), preloaded at startup and
+# filled lazily from the vectorstores on disk so every worker can serve every project
 rag_systems: Dict[str, LangGraphRAG] = {}
 
+# Per-project locks so concurrent first uses (e.g. a request during preload) load a project once
+rag_locks: Dict[str, threading.Lock] = {}
+rag_locks_guard = threading.Lock()
+
+def get_rag(project: Project) -> LangGraphRAG:
+    """Get a project's RAG system, loading it from its vectorstore on first use in this worker"""
+    rag_system = rag_systems.get(project.id)
+    if rag_system is not None:
+        return rag_system
+    
+    with rag_locks_guard:
+        lock = rag_locks.setdefault(project.id, threading.Lock())
+    
+    with lock:
+        rag_system = rag_systems.get(project.id)
+        if rag_system is None:
+            if not os.path.exists(project.vectorstore_path):
+                raise HTTPException(status_code=400, detail="Project RAG system not initialized")
+            rag_system = LangGraphRAG(vectorstore_path=project.vectorstore_path)
+            rag_system.load_vectorstore()
+            rag_systems[project.id] = rag_system
+    return rag_system
+
+def list_projects() -> List[Project]:
+    """Get all projects outside of a request"""
+    db = SessionLocal()
+    try:
+        return db.query(Project).all()
+    finally:
+        db.close()
+
+@app.on_event("startup")
+async def preload_rag_systems():
+    """Load every project's vectorstore so first queries in this worker don't pay for it"""
+    projects = await asyncio.to_thread(list_projects)
+    projects = [p for p in projects if p.vectorstore_path and os.path.exists(p.vectorstore_path)]
+    results = await asyncio.gather(
+        *[asyncio.to_thread(get_rag, p) for p in projects],
+        return_exceptions=True
+    )
+    for project, result in zip(projects, results):
+        if isinstance(result, Exception):
+            print(f"Failed to preload project {project.id}: {result}")
+
 class ProjectCreate(BaseModel):
     name: str
     description: Optional[str] = None
@@ -65,32 +133,76 @@ class QueryResponse(BaseModel):
     sources: List[str]
     message_id: str
 
+def save_project(db: Session, project: ProjectCreate, vectorstore_path: str) -> Project:
+    """Save a new project record"""
+    db_project = Project(
+        name=project.name,
+        description=project.description,
+        urls=project.urls,
+        vectorstore_path=vectorstore_path
+    )
+    db.add(db_project)
+    db.commit()
+    db.refresh(db_project)
+    return db_project
+
+def build_rag(vectorstore_path: str, urls: List[str]) -> LangGraphRAG:
+    """Build a new RAG system, from the given URLs or the default docs"""
+    rag_system = LangGraphRAG(vectorstore_path=vectorstore_path)
+    if urls:
+        rag_system.setup_rag_system(urls=urls, force_rebuild=True)
+    else:
+        rag_system.setup_rag_system(force_rebuild=True)
+    return rag_system
+
+def get_chat_project(db: Session, chat_id: str) -> Project:
+    """Get the project a chat belongs to"""
+    chat = db.query(Chat).filter(Chat.id == chat_id).first()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    
+    project = db.query(Project).filter(Project.id == chat.project_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project
+
+def save_exchange(chat_id: str, question: str, answer: str, sources: List[str]) -> str:
+    """Save a question and its answer to a chat, returning the assistant message id"""
+    db = SessionLocal()
+    try:
+        db.add(Message(
+            chat_id=chat_id,
+            role="user",
+            content=question
+        ))
+        assistant_message = Message(
+            chat_id=chat_id,
+            role="assistant",
+            content=answer,
+            sources=sources
+        )
+        db.add(assistant_message)
+        db.query(Chat).filter(Chat.id == chat_id).update({"updated_at": datetime.utcnow()})
+        db.commit()
+        db.refresh(assistant_message)
+        return assistant_message.id
+    finally:
+        db.close()
+
 # Project endpoints
 @app.post("/projects", response_model=ProjectResponse)
 async def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
     """Create a new RAG project"""
     try:
         # Create vectorstore path
-        vectorstore_path = f"projects/{project.name.replace(' ', '_').lower()}_vectorstore.parquet"
+        vectorstore_path = f"projects/{project.name.replace(' ', '_').lower()}_vectorstore"
         os.makedirs("projects", exist_ok=True)
         
         # Create database record
-        db_project = Project(
-            name=project.name,
-            description=project.description,
-            urls=project.urls,
-            vectorstore_path=vectorstore_path
-        )
-        db.add(db_project)
-        db.commit()
-        db.refresh(db_project)
+        db_project = await asyncio.to_thread(save_project, db, project, vectorstore_path)
         
-        # Initialize RAG system
-        rag_system = LangGraphRAG(vectorstore_path=vectorstore_path)
-        if project.urls:
-            rag_system.setup_rag_system(urls=project.urls, force_rebuild=True)
-        else:
-            rag_system.setup_rag_system(force_rebuild=True)
+        # Initialize RAG system in a worker thread; crawling and embedding can take minutes
+        rag_system = await asyncio.to_thread(build_rag, vectorstore_path, project.urls)
         
         # Store RAG system
         rag_systems[db_project.id] = rag_system
@@ -107,7 +219,7 @@ async def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/projects", response_model=List[ProjectResponse])
-async def get_projects(db: Session = Depends(get_db)):
+def get_projects(db: Session = Depends(get_db)):
     """Get all projects"""
     projects = db.query(Project).all()
     return [ProjectResponse(
@@ -120,17 +232,15 @@ async def get_projects(db: Session = Depends(get_db)):
     ) for p in projects]
 
 @app.get("/projects/{project_id}", response_model=ProjectResponse)
-async def get_project(project_id: str, db: Session = Depends(get_db)):
+def get_project(project_id: str, db: Session = Depends(get_db)):
     """Get a specific project"""
     project = db.query(Project).filter(Project.id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
     # Load RAG system if not already loaded
-    if project_id not in rag_systems and os.path.exists(project.vectorstore_path):
-        rag_system = LangGraphRAG(vectorstore_path=project.vectorstore_path)
-        rag_system.load_vectorstore()
-        rag_systems[project_id] = rag_system
+    if os.path.exists(project.vectorstore_path):
+        get_rag(project)
     
     return ProjectResponse(
         id=project.id,
@@ -143,7 +253,7 @@ async def get_project(project_id: str, db: Session = Depends(get_db)):
 
 # Chat endpoints
 @app.post("/chats", response_model=ChatResponse)
-async def create_chat(chat: ChatCreate, db: Session = Depends(get_db)):
+def create_chat(chat: ChatCreate, db: Session = Depends(get_db)):
     """Create a new chat in a project"""
     project = db.query(Project).filter(Project.id == chat.project_id).first()
     if not project:
@@ -166,7 +276,7 @@ async def create_chat(chat: ChatCreate, db: Session = Depends(get_db)):
     )
 
 @app.get("/projects/{project_id}/chats", response_model=List[ChatResponse])
-async def get_chats(project_id: str, db: Session = Depends(get_db)):
+def get_chats(project_id: str, db: Session = Depends(get_db)):
     """Get all chats for a project"""
     chats = db.query(Chat).filter(Chat.project_id == project_id).order_by(Chat.updated_at.desc()).all()
     return [ChatResponse(
@@ -178,7 +288,7 @@ async def get_chats(project_id: str, db: Session = Depends(get_db)):
     ) for c in chats]
 
 @app.get("/chats/{chat_id}/messages", response_model=List[MessageResponse])
-async def get_messages(chat_id: str, db: Session = Depends(get_db)):
+def get_messages(chat_id: str, db: Session = Depends(get_db)):
     """Get all messages in a chat"""
     messages = db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.created_at).all()
     return [MessageResponse(
@@ -193,66 +303,67 @@ async def get_messages(chat_id: str, db: Session = Depends(get_db)):
 async def query_rag(request: QueryRequest, db: Session = Depends(get_db)):
     """Query the RAG system and save to chat"""
     # Get chat and project
-    chat = db.query(Chat).filter(Chat.id == request.chat_id).first()
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
-    
-    project = db.query(Project).filter(Project.id == chat.project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    project = await asyncio.to_thread(get_chat_project, db, request.chat_id)
     
     # Get RAG system
-    if chat.project_id not in rag_systems:
-        if not os.path.exists(project.vectorstore_path):
-            raise HTTPException(status_code=400, detail="Project RAG system not initialized")
-        rag_system = LangGraphRAG(vectorstore_path=project.vectorstore_path)
-        rag_system.load_vectorstore()
-        rag_systems[chat.project_id] = rag_system
-    
-    rag_system = rag_systems[chat.project_id]
+    rag_system = await asyncio.to_thread(get_rag, project)
     
     try:
-        # Save user message
-        user_message = Message(
-            chat_id=request.chat_id,
-            role="user",
-            content=request.question
-        )
-        db.add(user_message)
-        
         # Get answer from RAG
-        answer = rag_system.query(request.question)
-        relevant_docs = rag_system.retriever.invoke(request.question)
-        sources = [doc.metadata.get('source', 'Unknown') for doc in relevant_docs]
+        result = await asyncio.to_thread(rag_system.query, request.question)
         
-        # Save assistant message
-        assistant_message = Message(
-            chat_id=request.chat_id,
-            role="assistant",
-            content=answer,
-            sources=sources
+        # Save user and assistant messages
+        message_id = await asyncio.to_thread(
+            save_exchange, request.chat_id, request.question, result.answer, result.sources
         )
-        db.add(assistant_message)
-        
-        # Update chat timestamp
-        chat.updated_at = datetime.utcnow()
-        
-        db.commit()
-        db.refresh(assistant_message)
         
         return QueryResponse(
-            answer=answer,
-            sources=sources,
-            message_id=assistant_message.id
+            answer=result.answer,
+            sources=result.sources,
+            message_id=message_id
         )
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/stream")
+async def query_rag_stream(request: QueryRequest, db: Session = Depends(get_db)):
+    """Query the RAG system, streaming the answer as server-sent events, and save to chat"""
+    project = await asyncio.to_thread(get_chat_project, db, request.chat_id)
+    rag_system = await asyncio.to_thread(get_rag, project)
+    
+    async def event_stream():
+        answer_parts = []
+        sources = []
+        try:
+            async for event in rag_system.query_stream(request.question):
+                if event["type"] == "sources":
+                    sources = event["sources"]
+                else:
+                    answer_parts.append(event["text"])
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+            return
+        
+        # Save messages only once the full answer has been generated
+        message_id = await asyncio.to_thread(
+            save_exchange, request.chat_id, request.question, "".join(answer_parts), sources
+        )
+        yield f"event: done\ndata: {json.dumps({'message_id': message_id})}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.get("/health")
 async def health():
     """Health check endpoint"""
     return {"status": "healthy", "loaded_projects": len(rag_systems)}
 
-if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+@app.get("/cache/stats")
+async def cache_stats():
+    """Semantic response cache hit/miss counters for projects loaded in this worker process (counters are per worker)"""
+    projects = {project_id: rag.response_cache.stats() for project_id, rag in rag_systems.items()}
+    return {
+        "hits": sum(stats["hits"] for stats in projects.values()),
+        "misses": sum(stats["misses"] for stats in projects.values()),
+        "projects": projects
+    }
\ No newline at end of file
@@ -0,0 +1,10 @@
+import os
+
+from models import create_tables
+
+
+def on_starting(server):
+    """Create the database schema once in the master process, before workers fork"""
+    create_tables()
+    # Inherited by the workers so backend skips its own schema creation
+    os.environ["RAG_SCHEMA_READY"] = "1"
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
@@ -30,6 +30,9 @@ class Chat(Base):
     
     project = relationship("Project", back_populates="chats")
     messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan")
+    
+    # Chats of a project are listed by most recent activity
+    __table_args__ = (Index("ix_chats_project_updated", "project_id", "updated_at"),)
 
 class Message(Base):
     __tablename__ = "messages"
@@ -42,14 +45,29 @@ class Message(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     chat = relationship("Chat", back_populates="messages")
+    
+    # Messages of a chat are listed in creation order
+    __table_args__ = (Index("ix_messages_chat_created", "chat_id", "created_at"),)
 
 # Database setup
 DATABASE_URL = "sqlite:///./rag_app.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=10,
+    max_overflow=20,
+    pool_timeout=30,
+    pool_recycle=1800,  # Replace connections older than 30 minutes
+    pool_pre_ping=True,  # Detect stale connections before handing them out
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    # create_all skips existing tables, so add indexes introduced after they were created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 def get_db():
     db = SessionLocal()
@@ -1,8 +1,23 @@
 import re, os
+import asyncio
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, List
+import faiss
+import numpy as np
 import tiktoken
 from dotenv import load_dotenv
 
-from bs4 import BeautifulSoup
+from selectolax.parser import HTMLParser
+from diskcache import Cache
 
 load_dotenv()
 
@@ -10,91 +25,363 @@ from langchain_community.document_loaders import RecursiveUrlLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_anthropic import ChatAnthropic
-from langchain_community.vectorstores import SKLearnVectorStore
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS, SKLearnVectorStore
+from langchain_core.messages import HumanMessage, SystemMessage
+
+# Number of documents retrieved as context for each question
+RETRIEVAL_K = 3
+
+# HNSW graph degree and search beam width for FAISS indexes
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+
+# Collapses runs of blank lines in extracted page text; matching three or more newlines
+# skips rewriting paragraph breaks that are already a single blank line
+_WS_RE = re.compile(r"\n{3,}")
+
+# Maximum number of URLs crawled concurrently
+MAX_CRAWL_WORKERS = 8
+
+@functools.lru_cache(maxsize=4)
+def _get_encoding(name):
+    """Load a tiktoken encoding once; parsing its BPE ranks is slow."""
+    return tiktoken.get_encoding(name)
+
+@dataclass
+class QueryResult:
+    """Answer to a query along with the sources and documents it was based on."""
+    answer: str
+    sources: List[str]
+    docs: List[Any] = field(default_factory=list)
+
+
+# Query embeddings kept in memory, shared by every project in the process
+EMBEDDING_MEMORY_CACHE_SIZE = 10_000
+_embedding_memory = OrderedDict()
+_embedding_memory_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def _get_disk_cache(directory):
+    """Open an on-disk embedding cache once per directory."""
+    return Cache(directory)
+
+
+class CachedOpenAIEmbeddings(OpenAIEmbeddings):
+    """
+    OpenAIEmbeddings with caches keyed by the SHA-256 of the text.
+    
+    Every embedding is cached on disk. Query embeddings are also kept in a process-wide
+    in-memory LRU; document embeddings are not, since ingestion would fill it with
+    vectors that the FAISS index already holds.
+    """
+
+    cache_dir: str = os.path.join(os.getcwd(), ".embcache")
+
+    def _cache_key(self, text):
+        return hashlib.sha256(f"{self.model}:{self.dimensions}:{text}".encode("utf-8")).hexdigest()
+
+    def _disk_cache(self):
+        return _get_disk_cache(self.cache_dir)
+
+    def embed_documents(self, texts, chunk_size=None, **kwargs):
+        """Embed texts, sending only those not already cached on disk to the API."""
+        disk = self._disk_cache()
+        keys = [self._cache_key(text) for text in texts]
+        embeddings = [disk.get(key) for key in keys]
+
+        # First position of every uncached text, so duplicates are embedded once
+        missing = {}
+        for i, (key, embedding) in enumerate(zip(keys, embeddings)):
+            if embedding is None:
+                missing.setdefault(key, i)
+
+        if missing:
+            fresh = super().embed_documents([texts[i] for i in missing.values()], chunk_size=chunk_size, **kwargs)
+            fresh_by_key = {}
+            for key, embedding in zip(missing, fresh):
+                fresh_by_key[key] = np.asarray(embedding, dtype=np.float32)
+                disk.set(key, fresh_by_key[key])
+            embeddings = [
+                embedding if embedding is not None else fresh_by_key[key]
+                for key, embedding in zip(keys, embeddings)
+            ]
+
+        return [np.asarray(embedding, dtype=np.float32).tolist() for embedding in embeddings]
+
+    def embed_query(self, text, **kwargs):
+        """Embed a single query, checking the in-memory LRU before the disk cache."""
+        key = self._cache_key(text)
+        with _embedding_memory_lock:
+            embedding = _embedding_memory.get(key)
+            if embedding is not None:
+                _embedding_memory.move_to_end(key)
+
+        if embedding is None:
+            embedding = np.asarray(self.embed_documents([text], **kwargs)[0], dtype=np.float32)
+            with _embedding_memory_lock:
+                _embedding_memory[key] = embedding
+                while len(_embedding_memory) > EMBEDDING_MEMORY_CACHE_SIZE:
+                    _embedding_memory.popitem(last=False)
+
+        return embedding.tolist()
+
+
+class SemanticResponseCache:
+    """
+    Cache of LLM answers keyed by question embedding, persisted to SQLite.
+    
+    The table is the source of truth and may be written by several worker processes;
+    each instance keeps an in-memory mirror of it for similarity search and brings the
+    mirror up to date before every lookup.
+    """
+
+    def __init__(self, path, similarity_threshold=0.92, ttl_secs=None, max_entries=1000):
+        """
+        Initialize the semantic response cache.
+        
+        Args:
+            path (str): Path to the SQLite file holding cached responses
+            similarity_threshold (float): Minimum cosine similarity for a cached answer to be reused
+            ttl_secs (float): Seconds before an entry expires, if None entries never expire
+            max_entries (int): Maximum number of entries, least recently used are evicted first
+        """
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.ttl_secs = ttl_secs
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # In-memory mirror of the table; embeddings are stored L2-normalized
+        self._ids = []
+        self._answers = []
+        self._sources = []
+        self._embeddings = None
+        self._last_seen_id = 0
+
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+            self._sync(conn)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _sync(self, conn):
+        """Drop mirrored entries deleted from the table and load rows added since the last sync."""
+        live_ids = {row_id for (row_id,) in conn.execute("SELECT id FROM responses")}
+        keep = [i for i, row_id in enumerate(self._ids) if row_id in live_ids]
+        if len(keep) < len(self._ids):
+            self._ids = [self._ids[i] for i in keep]
+            self._answers = [self._answers[i] for i in keep]
+            self._sources = [self._sources[i] for i in keep]
+            self._embeddings = self._embeddings[keep] if keep else None
+
+        rows = conn.execute(
+            "SELECT id, embedding, answer, sources FROM responses WHERE id > ? ORDER BY id",
+            (self._last_seen_id,)
+        ).fetchall()
+        if not rows:
+            return
+
+        vectors = []
+        for row_id, embedding, answer, sources in rows:
+            self._ids.append(row_id)
+            self._answers.append(answer)
+            self._sources.append(json.loads(sources))
+            vectors.append(np.frombuffer(embedding, dtype=np.float32))
+        if self._embeddings is not None:
+            vectors.insert(0, self._embeddings)
+        self._embeddings = np.vstack(vectors)
+        self._last_seen_id = rows[-1][0]
+
+    def lookup(self, embedding):
+        """Return the cached (answer, sources) for the closest question, or None on a miss."""
+        with self._lock, self._connect() as conn:
+            now = time.time()
+            if self.ttl_secs is not None:
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_secs,))
+            self._sync(conn)
+
+            if self._embeddings is not None:
+                similarities = self._embeddings @ self._normalize(embedding)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    updated = conn.execute(
+                        "UPDATE responses SET last_used = ? WHERE id = ?", (now, self._ids[best])
+                    ).rowcount
+                    # Another worker may have evicted the entry since the sync
+                    if updated:
+                        self.hits += 1
+                        return self._answers[best], self._sources[best]
+
+            self.misses += 1
+            return None
+
+    def insert(self, embedding, answer, sources):
+        """Store an answer for a question embedding, evicting the least recently used entries if full."""
+        vector = self._normalize(embedding)
+        with self._lock, self._connect() as conn:
+            now = time.time()
+            conn.execute(
+                "INSERT INTO responses (embedding, answer, sources, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (vector.tobytes(), answer, json.dumps(sources), now, now)
+            )
+            conn.execute(
+                "DELETE FROM responses WHERE id IN "
+                "(SELECT id FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._sync(conn)
+
+    def clear(self):
+        """Remove all cached responses."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+            self._sync(conn)
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached entries."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._ids)}
+
 
 class LangGraphRAG:
-    def __init__(self, vectorstore_path=None):
+    def __init__(self, vectorstore_path=None, similarity_threshold=0.92, cache_ttl_secs=None, cache_max_entries=1000, verbose=False):
         """
         Initialize the LangGraph RAG system.
         
         Args:
             vectorstore_path (str): Path to existing vectorstore, if None will create new one
+            similarity_threshold (float): Minimum question similarity to reuse a cached answer
+            cache_ttl_secs (float): Seconds before a cached answer expires, if None answers never expire
+            cache_max_entries (int): Maximum number of cached answers kept per vectorstore
+            verbose (bool): Report token counts of loaded and split documents
         """
-        self.vectorstore_path = vectorstore_path or os.path.join(os.getcwd(), "sklearn_vectorstore.parquet")
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+        self.verbose = verbose
+        self.vectorstore_path = vectorstore_path or os.path.join(os.getcwd(), "faiss_vectorstore")
+        self.response_cache_path = os.path.splitext(self.vectorstore_path)[0] + "_response_cache.sqlite"
+        # Retry embedding requests that hit rate limits
+        self.embeddings = CachedOpenAIEmbeddings(model="text-embedding-3-large", max_retries=6)
+        self._encoder = _get_encoding("cl100k_base")
         self.llm = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0)
         self.vectorstore = None
         self.retriever = None
+        self.response_cache = SemanticResponseCache(
+            self.response_cache_path,
+            similarity_threshold=similarity_threshold,
+            ttl_secs=cache_ttl_secs,
+            max_entries=cache_max_entries,
+        )
         
-        # Create the prompt template for RAG
-        self.prompt_template = ChatPromptTemplate.from_messages([
-            ("system", """You are a helpful assistant that answers questions about LangGraph documentation. 
-Use the provided context to answer the user's question accurately and comprehensively.
-
-Context:
-{context}
+        # Static system prompt; the retrieved context goes in the human message after it
+        self.system_prompt = """You are a helpful assistant that answers questions about LangGraph documentation. 
+Use the context provided with the user's question to answer it accurately and comprehensively.
 
 Instructions:
 - Answer based primarily on the provided context
 - If the context doesn't contain enough information, say so clearly
 - Be specific and cite relevant details from the documentation
-- If you're unsure, acknowledge the uncertainty"""),
-            ("human", "{question}")
-        ])
+- If you're unsure, acknowledge the uncertainty"""
     
     def count_tokens(self, text, model="cl100k_base"):
         """Count the number of tokens in the text using tiktoken."""
-        encoder = tiktoken.get_encoding(model)
-        return len(encoder.encode(text))
+        # encode_ordinary skips special-token checks, which plain document text doesn't need
+        return len(_get_encoding(model).encode_ordinary(text))
 
-    def bs4_extractor(self, html: str) -> str:
-        """Extract text content from HTML using BeautifulSoup."""
-        soup = BeautifulSoup(html, "lxml")
+    def count_tokens_batch(self, texts):
+        """Count the tokens in each text, encoding them in parallel."""
+        return [len(tokens) for tokens in self._encoder.encode_ordinary_batch(texts, num_threads=os.cpu_count())]
+
+    def html_extractor(self, html: str) -> str:
+        """Extract text content from HTML using selectolax."""
+        tree = HTMLParser(html)
+        
+        # Script and style contents are not page text
+        tree.strip_tags(["script", "style"])
         
         # Target the main article content for LangGraph documentation 
-        main_content = soup.find("article", class_="md-content__inner")
+        main_content = tree.css_first("article.md-content__inner")
         
         # If found, use that, otherwise fall back to the whole document
-        content = main_content.get_text() if main_content else soup.text
+        content = main_content.text() if main_content is not None else tree.text()
         
         # Clean up whitespace
-        content = re.sub(r"\n\n+", "\n\n", content).strip()
+        content = _WS_RE.sub("\n\n", content).strip()
         
         return content
 
-    def load_documents_from_urls(self, urls):
-        """Load documents from provided URLs."""
-        print("Loading documents from provided URLs...")
+    def html_metadata_extractor(self, raw_html: str, url: str, response) -> dict:
+        """Extract page metadata from HTML using selectolax."""
+        metadata = {"source": url, "content_type": response.headers.get("Content-Type", "")}
+        tree = HTMLParser(raw_html)
+        
+        title = tree.css_first("title")
+        if title is not None:
+            metadata["title"] = title.text(strip=True)
+        
+        description = tree.css_first('meta[name="description"]')
+        if description is not None:
+            metadata["description"] = description.attributes.get("content") or ""
+        
+        html = tree.css_first("html")
+        if html is not None and html.attributes.get("lang"):
+            metadata["language"] = html.attributes["lang"]
+        
+        return metadata
 
-        docs = []
-        for url in urls:
+    def crawl_urls(self, urls):
+        """Recursively crawl the URLs concurrently, returning documents in URL order."""
+        def crawl(url):
             loader = RecursiveUrlLoader(
                 url,
                 max_depth=5,
-                extractor=self.bs4_extractor,
+                extractor=self.html_extractor,
+                metadata_extractor=self.html_metadata_extractor,
             )
+            return list(loader.lazy_load())
 
-            # Load documents using lazy loading (memory efficient)
-            docs_lazy = loader.lazy_load()
+        # Each crawl is bound by HTTP round-trips, so threads overlap them
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_CRAWL_WORKERS, len(urls)))) as executor:
+            results = list(executor.map(crawl, urls))
+
+        return [doc for url_docs in results for doc in url_docs]
+
+    def load_documents_from_urls(self, urls):
+        """Load documents from provided URLs."""
+        print("Loading documents from provided URLs...")
 
-            # Load documents and track URLs
-            for d in docs_lazy:
-                docs.append(d)
+        docs = self.crawl_urls(urls)
 
         print(f"Loaded {len(docs)} documents from provided URLs.")
         print("\nLoaded URLs:")
         for i, doc in enumerate(docs):
             print(f"{i+1}. {doc.metadata.get('source', 'Unknown URL')}")
         
-        # Count total tokens in documents
-        total_tokens = 0
-        tokens_per_doc = []
-        for doc in docs:
-            doc_tokens = self.count_tokens(doc.page_content)
-            total_tokens += doc_tokens
-            tokens_per_doc.append(doc_tokens)
-        print(f"Total tokens in loaded documents: {total_tokens}")
+        # Count total tokens in documents (the text splitter tokenizes them again)
+        tokens_per_doc = None
+        if self.verbose:
+            tokens_per_doc = self.count_tokens_batch([doc.page_content for doc in docs])
+            print(f"Total tokens in loaded documents: {sum(tokens_per_doc)}")
         
         return docs, tokens_per_doc
 
@@ -111,47 +398,29 @@ Instructions:
             "https://langchain-ai.github.io/langgraph/tutorials/langgraph-platform/local-server/",
         ] 
 
-        docs = []
-        for url in urls:
-            loader = RecursiveUrlLoader(
-                url,
-                max_depth=5,
-                extractor=self.bs4_extractor,
-            )
-
-            # Load documents using lazy loading (memory efficient)
-            docs_lazy = loader.lazy_load()
-
-            # Load documents and track URLs
-            for d in docs_lazy:
-                docs.append(d)
+        docs = self.crawl_urls(urls)
 
         print(f"Loaded {len(docs)} documents from LangGraph documentation.")
         print("\nLoaded URLs:")
         for i, doc in enumerate(docs):
             print(f"{i+1}. {doc.metadata.get('source', 'Unknown URL')}")
         
-        # Count total tokens in documents
-        total_tokens = 0
-        tokens_per_doc = []
-        for doc in docs:
-            doc_tokens = self.count_tokens(doc.page_content)
-            total_tokens += doc_tokens
-            tokens_per_doc.append(doc_tokens)
-        print(f"Total tokens in loaded documents: {total_tokens}")
+        # Count total tokens in documents (the text splitter tokenizes them again)
+        tokens_per_doc = None
+        if self.verbose:
+            tokens_per_doc = self.count_tokens_batch([doc.page_content for doc in docs])
+            print(f"Total tokens in loaded documents: {sum(tokens_per_doc)}")
         
         return docs, tokens_per_doc
 
     def save_docs_to_file(self, documents, filename="llms_full.txt"):
         """Save the documents to a file."""
-        with open(filename, "w") as f:
-            for i, doc in enumerate(documents):
-                source = doc.metadata.get('source', 'Unknown URL')
-                f.write(f"DOCUMENT {i+1}\n")
-                f.write(f"SOURCE: {source}\n")
-                f.write("CONTENT:\n")
-                f.write(doc.page_content)
-                f.write("\n\n" + "="*80 + "\n\n")
+        separator = "\n\n" + "="*80 + "\n\n"
+        with open(filename, "w", buffering=1 << 20) as f:
+            f.writelines(
+                f"DOCUMENT {i+1}\nSOURCE: {doc.metadata.get('source', 'Unknown URL')}\nCONTENT:\n{doc.page_content}{separator}"
+                for i, doc in enumerate(documents)
+            )
 
         print(f"Documents saved to {filename}")
 
@@ -159,34 +428,53 @@ Instructions:
         """Split documents into smaller chunks for improved retrieval."""
         print("Splitting documents...")
         
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        # Measure chunks with the shared encoder rather than one built by from_tiktoken_encoder
+        text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=8000,  
-            chunk_overlap=500  
+            chunk_overlap=500,
+            length_function=self.count_tokens
         )
         
         split_docs = text_splitter.split_documents(documents)
         
         print(f"Created {len(split_docs)} chunks from documents.")
         
-        total_tokens = sum(self.count_tokens(doc.page_content) for doc in split_docs)
-        print(f"Total tokens in split documents: {total_tokens}")
+        if self.verbose:
+            total_tokens = sum(self.count_tokens_batch([doc.page_content for doc in split_docs]))
+            print(f"Total tokens in split documents: {total_tokens}")
         
         return split_docs
 
     def create_vectorstore(self, splits):
         """Create a vector store from document chunks."""
-        print("Creating SKLearnVectorStore...")
-        
-        vectorstore = SKLearnVectorStore.from_documents(
-            documents=splits,
-            embedding=self.embeddings,
-            persist_path=self.vectorstore_path,
-            serializer="parquet",
+        print("Creating FAISS vectorstore...")
+        
+        texts = [doc.page_content for doc in splits]
+        metadatas = [doc.metadata for doc in splits]
+        if not texts:
+            raise ValueError("No document chunks to index.")
+        
+        # Embed all chunks in batched requests; chunks embedded by earlier builds come from the cache
+        vectors = self.embeddings.embed_documents(texts)
+        
+        # HNSW graph index over 8-bit scalar-quantized vectors: approximately log(N) search,
+        # and a quarter of the FP32 bytes read per distance computation
+        matrix = np.asarray(vectors, dtype=np.float32)
+        index = faiss.IndexHNSWSQ(matrix.shape[1], faiss.ScalarQuantizer.QT_8bit, HNSW_M)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        # Learns the per-dimension value ranges used for quantization
+        index.train(matrix)
+        vectorstore = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
         )
-        print("SKLearnVectorStore created successfully.")
+        vectorstore.add_embeddings(zip(texts, vectors), metadatas=metadatas)
+        print("FAISS vectorstore created successfully.")
         
-        vectorstore.persist()
-        print(f"SKLearnVectorStore persisted to {self.vectorstore_path}")
+        vectorstore.save_local(self.vectorstore_path)
+        print(f"FAISS vectorstore persisted to {self.vectorstore_path}")
 
         return vectorstore
 
@@ -194,24 +482,44 @@ Instructions:
         """Load existing vectorstore from disk."""
         if os.path.exists(self.vectorstore_path):
             print(f"Loading existing vectorstore from {self.vectorstore_path}")
-            self.vectorstore = SKLearnVectorStore(
-                embedding=self.embeddings,
-                persist_path=self.vectorstore_path,
-                serializer="parquet"
-            )
-            self.retriever = self.vectorstore.as_retriever(search_kwargs={"k": 3})
+            if self.vectorstore_path.endswith(".parquet"):
+                # Projects created before the switch to FAISS
+                self.vectorstore = SKLearnVectorStore(
+                    embedding=self.embeddings,
+                    persist_path=self.vectorstore_path,
+                    serializer="parquet"
+                )
+            else:
+                # The index and docstore are written by create_vectorstore, so they are trusted
+                self.vectorstore = FAISS.load_local(
+                    self.vectorstore_path,
+                    self.embeddings,
+                    allow_dangerous_deserialization=True
+                )
+                self.vectorstore.index.hnsw.efSearch = HNSW_EF_SEARCH
+            self.retriever = self.vectorstore.as_retriever(search_kwargs={"k": RETRIEVAL_K})
             return True
         else:
             print(f"Vectorstore not found at {self.vectorstore_path}")
             return False
 
-    def setup_rag_system(self, urls=None, force_rebuild=False):
-        """Set up the complete RAG system."""
+    def setup_rag_system(self, urls=None, force_rebuild=False, save_corpus=False):
+        """
+        Set up the complete RAG system.
+        
+        Args:
+            urls (list): URLs to build the vectorstore from, if None the LangGraph docs are used
+            force_rebuild (bool): Rebuild the vectorstore even if one exists
+            save_corpus (bool): Also write the loaded documents to llms_full.txt
+        """
         if not force_rebuild and self.load_vectorstore():
             print("Using existing vectorstore.")
             return
         
         print("Building new vectorstore...")
+        # Cached answers refer to the old documents
+        self.response_cache.clear()
+
         # Load documents
         if urls:
             documents, _ = self.load_documents_from_urls(urls)
@@ -219,56 +527,132 @@ Instructions:
             documents, _ = self.load_langgraph_docs()
         
         # Save documents to file (optional)
-        self.save_docs_to_file(documents)
+        if save_corpus:
+            self.save_docs_to_file(documents)
         
         # Split documents
         split_docs = self.split_documents(documents)
         
         # Create vectorstore
         self.vectorstore = self.create_vectorstore(split_docs)
-        self.retriever = self.vectorstore.as_retriever(search_kwargs={"k": 3})
+        self.retriever = self.vectorstore.as_retriever(search_kwargs={"k": RETRIEVAL_K})
+
+    def retrieve_context(self, query: str, docs=None) -> str:
+        """Retrieve relevant context for a query, or format already retrieved docs."""
+        if docs is not None:
+            return self.format_context(docs)
 
-    def retrieve_context(self, query: str) -> str:
-        """Retrieve relevant context for a query."""
         if not self.retriever:
             raise ValueError("RAG system not initialized. Call setup_rag_system() first.")
         
         relevant_docs = self.retriever.invoke(query)
         print(f"Retrieved {len(relevant_docs)} relevant documents")
         
-        # Format context from retrieved documents
-        formatted_context = "\n\n".join([
+        return self.format_context(relevant_docs)
+
+    def retrieve_docs_by_embedding(self, question: str, question_embedding):
+        """Retrieve relevant documents for a question that has already been embedded."""
+        if isinstance(self.vectorstore, FAISS):
+            return self.vectorstore.similarity_search_by_vector(question_embedding, k=RETRIEVAL_K)
+        
+        # SKLearnVectorStore has no search by vector; the retriever's embed_query is served from the embedding cache
+        return self.retriever.invoke(question)
+
+    def format_context(self, relevant_docs) -> str:
+        """Format retrieved documents into a context string for the prompt."""
+        return "\n\n".join([
             f"==DOCUMENT {i+1}==\nSource: {doc.metadata.get('source', 'Unknown')}\nContent: {doc.page_content}" 
             for i, doc in enumerate(relevant_docs)
         ])
-        
-        return formatted_context
 
-    def query(self, question: str) -> str:
+    def build_messages(self, context: str, question: str):
+        """Build the LLM messages from the static system prompt, the retrieved context and the question."""
+        return [
+            SystemMessage(content=self.system_prompt),
+            HumanMessage(content=f"Context:\n{context}\n\nQuestion: {question}"),
+        ]
+
+    def prepare_query(self, question: str):
         """
-        Query the RAG system and get an answer.
+        Embed a question and look up a cached answer, retrieving relevant documents on a miss.
         
         Args:
             question (str): The question to ask about LangGraph
             
         Returns:
-            str: The answer based on the retrieved context
+            tuple: (question embedding, cached QueryResult or None, retrieved documents)
         """
         if not self.retriever:
             raise ValueError("RAG system not initialized. Call setup_rag_system() first.")
         
-        # Retrieve relevant context
-        context = self.retrieve_context(question)
+        # Reuse the answer to a semantically equivalent earlier question
+        question_embedding = self.embeddings.embed_query(question)
+        cached = self.response_cache.lookup(question_embedding)
+        if cached:
+            print("Semantic cache hit")
+            answer, sources = cached
+            return question_embedding, QueryResult(answer=answer, sources=sources), []
+        
+        # Retrieve relevant context with the same embedding
+        relevant_docs = self.retrieve_docs_by_embedding(question, question_embedding)
+        print(f"Retrieved {len(relevant_docs)} relevant documents")
+        return question_embedding, None, relevant_docs
+
+    def query(self, question: str) -> QueryResult:
+        """
+        Query the RAG system and get an answer.
+        
+        Args:
+            question (str): The question to ask about LangGraph
+            
+        Returns:
+            QueryResult: The answer based on the retrieved context, with its sources
+        """
+        question_embedding, cached, relevant_docs = self.prepare_query(question)
+        if cached:
+            return cached
+        
+        context = self.retrieve_context(question, docs=relevant_docs)
         
         # Generate response using the LLM
-        messages = self.prompt_template.format_messages(
-            context=context,
-            question=question
-        )
+        messages = self.build_messages(context, question)
         
         response = self.llm.invoke(messages)
-        return response.content
+        
+        sources = [doc.metadata.get('source', 'Unknown') for doc in relevant_docs]
+        self.response_cache.insert(question_embedding, response.content, sources)
+        return QueryResult(answer=response.content, sources=sources, docs=relevant_docs)
 
+    async def query_stream(self, question: str):
+        """
+        Query the RAG system and stream the answer as it is generated.
+        
+        Args:
+            question (str): The question to ask about LangGraph
+            
+        Yields:
+            dict: A {"type": "sources"} event with the answer's sources, then
+                {"type": "token"} events carrying the answer text
+        """
+        # Embedding and retrieval are blocking calls
+        question_embedding, cached, relevant_docs = await asyncio.to_thread(self.prepare_query, question)
+        if cached:
+            yield {"type": "sources", "sources": cached.sources}
+            yield {"type": "token", "text": cached.answer}
+            return
+        
+        sources = [doc.metadata.get('source', 'Unknown') for doc in relevant_docs]
+        yield {"type": "sources", "sources": sources}
+        
+        messages = self.build_messages(self.retrieve_context(question, docs=relevant_docs), question)
+        
+        answer_parts = []
+        async for chunk in self.llm.astream(messages):
+            if chunk.content:
+                answer_parts.append(chunk.content)
+                yield {"type": "token", "text": chunk.content}
+        
+        await asyncio.to_thread(self.response_cache.insert, question_embedding, "".join(answer_parts), sources)
 
 def main():
     """Interactive RAG system that accepts user input for URLs and queries."""
@@ -291,15 +675,15 @@ def main():
             urls.append(url)
     
     # Initialize the RAG system
-    rag_system = LangGraphRAG()
+    rag_system = LangGraphRAG(verbose=True)
     
     # Set up the system with user-provided URLs or default
     if urls:
         print(f"\nSetting up RAG system with {len(urls)} URLs...")
-        rag_system.setup_rag_system(urls=urls)
+        rag_system.setup_rag_system(urls=urls, save_corpus=True)
     else:
         print("\nSetting up RAG system with default LangGraph documentation...")
-        rag_system.setup_rag_system()
+        rag_system.setup_rag_system(save_corpus=True)
     
     print("\n" + "="*50)
     print("RAG System Ready - Enter your queries")
@@ -322,8 +706,8 @@ def main():
         print("-" * 30)
         
         try:
-            answer = rag_system.query(query)
-            print(f"\nAnswer: {answer}")
+            result = rag_system.query(query)
+            print(f"\nAnswer: {result.answer}")
         except Exception as e:
             print(f"Error: {e}")
         
@@ -8,7 +8,7 @@ import os
 def run_backend():
     """Run the FastAPI backend server"""
     print("Starting FastAPI backend on http://localhost:8000")
-    subprocess.run([sys.executable, "backend.py"])
+    subprocess.run(["sh", "start.sh"])
 
 def run_frontend():
     """Run the React frontend development server"""
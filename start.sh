@@ -0,0 +1,8 @@
+#!/bin/sh
+# Serve the API from multiple Uvicorn worker processes; project creation can take minutes.
+# gunicorn.conf.py creates the database schema once before the workers fork.
+exec gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker \
+    -w "${WEB_CONCURRENCY:-8}" \
+    --timeout 300 \
+    --bind 0.0.0.0:8000 \
+    backend:app